@@ -1,26 +1,38 @@
-from passlib.hash import pbkdf2_sha256
-from jose import JWTError, jwt
 import datetime
 import os
 from dotenv import load_dotenv
 import logging
 from logger_config import setup_logger
 
+load_dotenv()
+
 # Setup logger
 logger = setup_logger()
 
-load_dotenv()
-
 SECRET_KEY = os.getenv('SECRET_KEY')
 if not SECRET_KEY:
     SECRET_KEY = "your-fallback-secret-key"  # For development only
     logger.warning("SECRET_KEY not found in .env, using fallback key")
 
+# passlib and jose are imported inside the functions below so that they load on first
+# use (or in preload()) instead of on every worker start.
+
+def preload():
+    """
+    Import the password hashing and JWT libraries ahead of first use
+    """
+    try:
+        from passlib.hash import pbkdf2_sha256
+        from jose import jwt
+    except Exception as e:
+        logger.error(f"Error preloading auth libraries: {str(e)}")
+
 def hash_password(password: str) -> str:
     """
     Hash a password using pbkdf2_sha256
     """
     try:
+        from passlib.hash import pbkdf2_sha256
         return pbkdf2_sha256.hash(password)
     except Exception as e:
         logger.error(f"Error hashing password: {str(e)}")
@@ -31,6 +43,7 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Verify a password against a hash
     """
     try:
+        from passlib.hash import pbkdf2_sha256
         return pbkdf2_sha256.verify(plain_password, hashed_password)
     except Exception as e:
         logger.error(f"Error verifying password: {str(e)}")
@@ -41,6 +54,7 @@ def create_access_token(data: dict) -> str:
     Create a JWT token
     """
     try:
+        from jose import jwt
         to_encode = data.copy()
         expire = datetime.datetime.utcnow() + datetime.timedelta(hours=24)
         to_encode.update({"exp": expire})
@@ -54,6 +68,7 @@ def verify_token(token: str) -> dict:
     """
     Verify a JWT token
     """
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         return payload
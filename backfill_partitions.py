@@ -0,0 +1,349 @@
+"""
+Online backfill of an existing music_videos heap table into its partitioned replacement.
+
+init_db() creates music_videos_partitioned when MUSIC_VIDEOS_PARTITIONING is set and
+music_videos is still a plain table. This tool then:
+
+1. installs a trigger that mirrors writes on music_videos into the new table,
+2. copies existing rows in small keyset chunks, each in its own short transaction,
+3. with --swap, renames the tables in one brief transaction (the old table is kept
+   as music_videos_old until it is dropped by hand).
+
+With --drain-default (range mode) it instead moves rows that landed in
+music_videos_default because their month's partition did not exist yet: the month is
+built as a standalone table the same way (sync trigger plus chunked copy) and then
+attached in one short transaction.
+
+Usage:
+    python backfill_partitions.py [--chunk-size 5000] [--pause 0.05] [--start-id 0] [--swap]
+    python backfill_partitions.py --drain-default [--chunk-size 5000] [--pause 0.05]
+"""
+import argparse
+import time
+import traceback
+
+from psycopg2.errors import CheckViolation
+
+from database import (
+    get_database_connection, get_table_kind, partition_key_columns, add_months,
+    month_partition_name, PARTITION_MODE, PARTITIONED_TABLE
+)
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+COLUMNS = "id, title, artist, url, user_id, created_at"
+
+def install_trigger(conn, name, source, target, conflict, updates, condition):
+    """
+    Mirror inserts, updates and deletes on source into target while rows are copied
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(f'''
+            CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {target} WHERE id = OLD.id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND {condition} THEN
+                    INSERT INTO {target} ({COLUMNS})
+                    VALUES (NEW.id, NEW.title, NEW.artist, NEW.url, NEW.user_id,
+                            COALESCE(NEW.created_at, CURRENT_TIMESTAMP))
+                    ON CONFLICT ({conflict}) DO UPDATE SET {updates};
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cur.execute(f"DROP TRIGGER IF EXISTS {name} ON {source}")
+        cur.execute(f'''
+            CREATE TRIGGER {name}
+            AFTER INSERT OR UPDATE OR DELETE ON {source}
+            FOR EACH ROW EXECUTE FUNCTION {name}()
+        ''')
+        conn.commit()
+        logger.info(f"Installed {name} trigger on {source}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def updates_for(key):
+    return ", ".join(
+        f"{column} = EXCLUDED.{column}"
+        for column in ("title", "artist", "url", "user_id", "created_at")
+        if column not in key
+    )
+
+def install_sync_trigger(conn):
+    key = partition_key_columns()
+    install_trigger(
+        conn, "music_videos_sync_partitioned", "music_videos", PARTITIONED_TABLE,
+        ", ".join(key), updates_for(key), "NEW.user_id IS NOT NULL"
+    )
+
+def copy_chunk(conn, after_id, chunk_size, lock_timeout, source='music_videos',
+               target=PARTITIONED_TABLE, condition="user_id IS NOT NULL", condition_params=()):
+    """
+    Copy the next chunk of rows with id > after_id; returns (last_id, rows_copied)
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+        # FOR SHARE holds off concurrent updates/deletes of just these rows until the
+        # chunk commits, so the sync trigger cannot be overtaken by a stale copy.
+        cur.execute(f'''
+            WITH chunk AS (
+                SELECT {COLUMNS}
+                FROM {source}
+                WHERE id > %s AND {condition}
+                ORDER BY id
+                LIMIT %s
+                FOR SHARE
+            ), copied AS (
+                INSERT INTO {target} ({COLUMNS})
+                SELECT id, title, artist, url, user_id, COALESCE(created_at, CURRENT_TIMESTAMP)
+                FROM chunk
+                ON CONFLICT DO NOTHING
+            )
+            SELECT MAX(id), COUNT(*) FROM chunk
+        ''', (after_id, *condition_params, chunk_size))
+        last_id, copied = cur.fetchone()
+        conn.commit()
+        return last_id, copied
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def backfill(conn, start_id=0, chunk_size=5000, pause=0.05, lock_timeout='2s', **copy_args):
+    after_id = start_id
+    total = 0
+    while True:
+        last_id, copied = copy_chunk(conn, after_id, chunk_size, lock_timeout, **copy_args)
+        if not copied:
+            break
+        after_id = last_id
+        total += copied
+        logger.info(f"Backfill progress: {total} rows copied, last id {after_id}")
+        if pause:
+            time.sleep(pause)
+    logger.info(f"Backfill finished: {total} rows copied")
+    return total
+
+def require_not_null_user_id(conn, lock_timeout):
+    """
+    Add and validate a CHECK (user_id IS NOT NULL) on music_videos, so no row without a
+    user can be written after the check and be left behind by the swap
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+        cur.execute('''
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = 'music_videos'::regclass AND conname = 'music_videos_user_id_not_null'
+        ''')
+        if cur.fetchone() is None:
+            cur.execute('''
+                ALTER TABLE music_videos
+                ADD CONSTRAINT music_videos_user_id_not_null CHECK (user_id IS NOT NULL) NOT VALID
+            ''')
+        conn.commit()
+        # VALIDATE only takes a SHARE UPDATE EXCLUSIVE lock, so reads and writes continue
+        cur.execute("ALTER TABLE music_videos VALIDATE CONSTRAINT music_videos_user_id_not_null")
+        conn.commit()
+    except CheckViolation as e:
+        conn.rollback()
+        raise RuntimeError(
+            "music_videos has rows without user_id; assign or delete them before swapping"
+        ) from e
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def swap_tables(conn, lock_timeout='5s'):
+    require_not_null_user_id(conn, lock_timeout)
+    cur = conn.cursor()
+    try:
+        # The sync trigger writes in the same transaction as the change it mirrors, so in
+        # one snapshot both tables hold the same rows once the copy is complete
+        cur.execute(f"SELECT (SELECT COUNT(*) FROM music_videos), (SELECT COUNT(*) FROM {PARTITIONED_TABLE})")
+        source_rows, target_rows = cur.fetchone()
+        if source_rows != target_rows:
+            raise RuntimeError(
+                f"Copy incomplete: music_videos has {source_rows} rows, {PARTITIONED_TABLE} has "
+                f"{target_rows}; rerun the backfill without --start-id before swapping"
+            )
+        conn.commit()
+
+        cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+        cur.execute("LOCK TABLE music_videos IN ACCESS EXCLUSIVE MODE")
+        # Cheap final check under the lock; the constraint rules out rows without a user
+        cur.execute(f"SELECT (SELECT MAX(id) FROM music_videos), (SELECT MAX(id) FROM {PARTITIONED_TABLE})")
+        source_max, target_max = cur.fetchone()
+        if source_max != target_max:
+            raise RuntimeError(
+                f"Copy incomplete: max id {source_max} in music_videos, {target_max} in {PARTITIONED_TABLE}"
+            )
+        cur.execute("DROP TRIGGER IF EXISTS music_videos_sync_partitioned ON music_videos")
+        cur.execute("ALTER TABLE music_videos RENAME TO music_videos_old")
+        cur.execute(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO music_videos")
+        # Continue the identity after the highest id handed out by the old SERIAL
+        cur.execute('''
+            SELECT setval(
+                pg_get_serial_sequence('music_videos', 'id'),
+                (SELECT COALESCE(MAX(id), 0) + 1 FROM music_videos_old),
+                false
+            )
+        ''')
+        cur.execute("DROP FUNCTION IF EXISTS music_videos_sync_partitioned()")
+        conn.commit()
+        logger.info("Swapped music_videos to the partitioned table; old rows kept in music_videos_old")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def stranded_months(conn):
+    """
+    Return (parent table, [months]) for rows in music_videos_default whose month has no partition
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute('''
+            SELECT inhparent::regclass::text FROM pg_inherits
+            WHERE inhrelid = to_regclass('music_videos_default')
+        ''')
+        row = cur.fetchone()
+        if row is None:
+            return None, []
+        cur.execute('''
+            SELECT DISTINCT date_trunc('month', created_at)::date
+            FROM music_videos_default
+            ORDER BY 1
+        ''')
+        # A staging table left by an interrupted drain is not attached yet and is reused
+        months = [month for (month,) in cur.fetchall()
+                  if not is_attached(cur, month_partition_name(month))]
+        conn.commit()
+        return row[0], months
+    finally:
+        cur.close()
+
+def is_attached(cur, table_name):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s))", (table_name,))
+    return cur.fetchone()[0]
+
+def drain_month(conn, parent, month, chunk_size, pause, lock_timeout):
+    partition = month_partition_name(month)
+    bounds = (month, add_months(month, 1))
+    in_month = "created_at >= %s AND created_at < %s"
+    trigger = "music_videos_sync_default"
+
+    cur = conn.cursor()
+    try:
+        # Build the month as a standalone table with everything ATTACH would otherwise have
+        # to create or validate while holding its locks: keys, index, foreign key, range check
+        if get_table_kind(cur, partition) is None:
+            cur.execute(f"CREATE TABLE {partition} (LIKE {parent} INCLUDING DEFAULTS)")
+            cur.execute(f"ALTER TABLE {partition} ADD PRIMARY KEY (id, created_at)")
+            cur.execute(f"CREATE INDEX ON {partition} (user_id, created_at DESC)")
+            cur.execute(f"ALTER TABLE {partition} ADD FOREIGN KEY (user_id) REFERENCES users(id)")
+            cur.execute(f"ALTER TABLE {partition} ADD CONSTRAINT {partition}_range CHECK ({in_month})", bounds)
+        trigger_condition = cur.mogrify("NEW.created_at >= %s AND NEW.created_at < %s", bounds).decode()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    install_trigger(conn, trigger, "music_videos_default", partition, "id, created_at",
+                    updates_for(("id", "created_at")), trigger_condition)
+    backfill(conn, 0, chunk_size, pause, lock_timeout, source="music_videos_default",
+             target=partition, condition=in_month, condition_params=bounds)
+
+    cur = conn.cursor()
+    try:
+        cur.execute(f'''
+            SELECT (SELECT COUNT(*) FROM music_videos_default WHERE {in_month}),
+                   (SELECT COUNT(*) FROM {partition})
+        ''', bounds)
+        source_rows, target_rows = cur.fetchone()
+        if source_rows != target_rows:
+            raise RuntimeError(f"Copy of {partition} incomplete: {source_rows} vs {target_rows} rows")
+        conn.commit()
+
+        # Only the rows that leaked into the default partition are deleted under the lock
+        cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+        cur.execute("LOCK TABLE music_videos_default IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger} ON music_videos_default")
+        cur.execute(f"DELETE FROM music_videos_default WHERE {in_month}", bounds)
+        cur.execute(f"ALTER TABLE {parent} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)", bounds)
+        cur.execute(f"DROP FUNCTION IF EXISTS {trigger}()")
+        conn.commit()
+        logger.info(f"Moved {target_rows} rows from music_videos_default into {partition}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def drain_default(conn, chunk_size, pause, lock_timeout):
+    parent, months = stranded_months(conn)
+    if not months:
+        logger.info("music_videos_default holds no rows for missing months; nothing to do")
+        return
+    for month in months:
+        drain_month(conn, parent, month, chunk_size, pause, lock_timeout)
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill music_videos into its partitioned table")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows copied per transaction")
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between chunks")
+    parser.add_argument("--start-id", type=int, default=0, help="Resume after this id")
+    parser.add_argument("--lock-timeout", default="2s", help="lock_timeout for each chunk")
+    parser.add_argument("--swap", action="store_true", help="Swap tables once the copy completes")
+    parser.add_argument("--drain-default", action="store_true",
+                        help="Move rows out of music_videos_default into their month partitions")
+    args = parser.parse_args()
+
+    if PARTITION_MODE == 'none':
+        parser.error("Set MUSIC_VIDEOS_PARTITIONING to 'hash' or 'range' first")
+    if args.drain_default and PARTITION_MODE != 'range':
+        parser.error("--drain-default only applies to MUSIC_VIDEOS_PARTITIONING=range")
+
+    conn = get_database_connection('admin')
+    try:
+        if args.drain_default:
+            drain_default(conn, args.chunk_size, args.pause, args.lock_timeout)
+            return
+
+        cur = conn.cursor()
+        kinds = (get_table_kind(cur, 'music_videos'), get_table_kind(cur, PARTITIONED_TABLE))
+        cur.close()
+        conn.commit()
+        if kinds[0] == 'partitioned':
+            logger.info("music_videos is already partitioned; nothing to do")
+            return
+        if kinds[1] != 'partitioned':
+            parser.error(f"{PARTITIONED_TABLE} does not exist; start the app once to run init_db()")
+
+        install_sync_trigger(conn)
+        backfill(conn, args.start_id, args.chunk_size, args.pause, args.lock_timeout)
+        if args.swap:
+            swap_tables(conn)
+    except Exception as e:
+        logger.error(f"Backfill error: {str(e)}\n{traceback.format_exc()}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
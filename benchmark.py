@@ -0,0 +1,167 @@
+"""
+Benchmarks for the music video queries.
+
+    python benchmark.py partitioning [--users 20] [--iterations 20] [--term a]
+    python benchmark.py startup [--runs 5] [--top 15] [--target-ms 1500]
+
+partitioning runs the per-user list and search queries from the List/Search tabs
+against the users with the most videos and prints latency percentiles. Run it before
+and after enabling MUSIC_VIDEOS_PARTITIONING (and the backfill) to compare.
+
+startup prints a -X importtime report for the app modules and measures the time to
+first render: a fresh interpreter importing main.py and rendering the logged-out page
+(Streamlit bare mode), compared against STARTUP_TARGET_MS.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from database import get_database_connection, get_table_kind, PARTITION_MODE
+
+LIST_QUERY = """
+    SELECT id, title, artist, url, created_at
+    FROM music_videos
+    WHERE user_id = %s
+    ORDER BY created_at DESC
+"""
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Time-to-first-render budget for a cold worker, in milliseconds
+STARTUP_TARGET_MS = int(os.getenv('STARTUP_TARGET_MS', '1500'))
+
+SEARCH_QUERY = """
+    SELECT id, title, artist, url
+    FROM music_videos
+    WHERE user_id = %s AND title ILIKE %s
+"""
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def time_query(cur, query, params, iterations):
+    samples = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - start_time) * 1000)
+    return samples
+
+def report(name, samples):
+    print(
+        f"{name:<10} n={len(samples):<6} p50={percentile(samples, 50):8.2f}ms "
+        f"p95={percentile(samples, 95):8.2f}ms max={max(samples):8.2f}ms "
+        f"mean={statistics.mean(samples):8.2f}ms"
+    )
+
+def bench_partitioning(args):
+    conn = get_database_connection('admin')
+    cur = conn.cursor()
+    try:
+        print(f"music_videos: {get_table_kind(cur, 'music_videos')} (MUSIC_VIDEOS_PARTITIONING={PARTITION_MODE})")
+        cur.execute("""
+            SELECT user_id, COUNT(*)
+            FROM music_videos
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id
+            ORDER BY COUNT(*) DESC
+            LIMIT %s
+        """, (args.users,))
+        users = cur.fetchall()
+        if not users:
+            print("No videos found; nothing to benchmark")
+            return
+
+        list_samples, search_samples = [], []
+        for user_id, _ in users:
+            list_samples += time_query(cur, LIST_QUERY, (user_id,), args.iterations)
+            search_samples += time_query(cur, SEARCH_QUERY, (user_id, f"%{args.term}%"), args.iterations)
+        conn.rollback()
+
+        print(f"users={len(users)} videos/user max={users[0][1]} min={users[-1][1]}")
+        report("list", list_samples)
+        report("search", search_samples)
+    finally:
+        cur.close()
+        conn.close()
+
+def run_python(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+
+def parse_importtime(output, parent="main"):
+    """
+    Return (cumulative_us, self_us, module) for each direct import of parent in
+    -X importtime output
+    """
+    children = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level after the separator, and a
+        # module's line is printed after the lines of everything it imported
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative_us), int(self_us), name.strip()))
+        elif depth == 0:
+            if name.strip() == parent:
+                return children
+            children = []
+    return []
+
+def bench_startup(args):
+    result = run_python("import main", "-X", "importtime")
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit("Importing main.py failed; is DATABASE_URL reachable?")
+
+    imports = sorted(parse_importtime(result.stderr), reverse=True)
+    total_us = sum(cumulative for cumulative, _, _ in imports)
+    print(f"Imports made by main.py: {total_us / 1000:.1f}ms cumulative")
+    for cumulative, self_us, name in imports[:args.top]:
+        print(f"  {cumulative / 1000:9.1f}ms  (self {self_us / 1000:7.1f}ms)  {name}")
+
+    samples = []
+    for _ in range(args.runs):
+        start_time = time.perf_counter()
+        result = run_python("import main; main.main()")
+        samples.append((time.perf_counter() - start_time) * 1000)
+        if result.returncode != 0:
+            print(result.stderr[-2000:])
+            sys.exit("Rendering main.py failed")
+
+    first_render = statistics.median(samples)
+    status = "OK" if first_render <= args.target_ms else "OVER TARGET"
+    print(f"Time to first render: median {first_render:.0f}ms over {args.runs} runs "
+          f"(target {args.target_ms}ms) {status}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Music video benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    partitioning = subparsers.add_parser("partitioning", help="Per-user list/search latency")
+    partitioning.add_argument("--users", type=int, default=20, help="Number of heaviest users to query")
+    partitioning.add_argument("--iterations", type=int, default=20, help="Runs per query and user")
+    partitioning.add_argument("--term", default="a", help="Search term for the ILIKE query")
+    partitioning.set_defaults(func=bench_partitioning)
+
+    startup = subparsers.add_parser("startup", help="Import-time report and time to first render")
+    startup.add_argument("--runs", type=int, default=5, help="Cold starts to time")
+    startup.add_argument("--top", type=int, default=15, help="Slowest imports made by main.py to list")
+    startup.add_argument("--target-ms", type=int, default=STARTUP_TARGET_MS, help="Time-to-first-render target")
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,264 @@
-from logger_config import setup_logger
+from logger_config import setup_logger, log_event
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.errors import QueryCanceled
 import os
+import select
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import date
+from dotenv import load_dotenv
+
+# Settings below come from the environment, which may be configured through .env
+load_dotenv()
 
 logger = setup_logger()
 
-def get_database_connection():
+# Optional partitioning of music_videos: 'none', 'hash' (by user_id) or 'range' (by created_at)
+PARTITION_MODE = os.getenv('MUSIC_VIDEOS_PARTITIONING', 'none').lower()
+if PARTITION_MODE not in ('none', 'hash', 'range'):
+    raise ValueError(
+        f"MUSIC_VIDEOS_PARTITIONING must be 'none', 'hash' or 'range', got {PARTITION_MODE!r}"
+    )
+HASH_PARTITIONS = int(os.getenv('MUSIC_VIDEOS_HASH_PARTITIONS', '16'))
+RANGE_MONTHS_AHEAD = int(os.getenv('MUSIC_VIDEOS_RANGE_MONTHS_AHEAD', '3'))
+
+# Target table used while an existing heap table is backfilled (see backfill_partitions.py)
+PARTITIONED_TABLE = 'music_videos_partitioned'
+
+# How long init_db() waits for a table lock before giving up instead of blocking the app
+MIGRATION_LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '5s')
+
+# statement_timeout per operation class in milliseconds (0 disables the timeout)
+STATEMENT_TIMEOUTS = {
+    'interactive': int(os.getenv('STATEMENT_TIMEOUT_INTERACTIVE_MS', '5000')),
+    'admin': int(os.getenv('STATEMENT_TIMEOUT_ADMIN_MS', '0')),
+}
+
+# Heavy queries (searches, aggregates) a single user may run at once before new ones are shed
+MAX_HEAVY_QUERIES_PER_USER = int(os.getenv('MAX_HEAVY_QUERIES_PER_USER', '2'))
+
+# How often a waiting query checks whether it should be cancelled, in seconds
+CANCEL_POLL_INTERVAL = 0.1
+
+class QueryBackpressureError(Exception):
+    """
+    Raised when a user already has MAX_HEAVY_QUERIES_PER_USER heavy queries running
+    """
+
+_running_heavy_queries = {}
+_running_heavy_queries_lock = threading.Lock()
+_cancel_check = threading.local()
+
+def _wait_select_cancellable(conn):
+    """
+    psycopg2 wait callback modelled on extras.wait_select that cancels the running
+    statement once the cancel check registered for this thread returns True
+    """
+    cancelled = False
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            ready = select.select([conn.fileno()], [], [], CANCEL_POLL_INTERVAL)[0]
+        elif state == extensions.POLL_WRITE:
+            ready = select.select([], [conn.fileno()], [], CANCEL_POLL_INTERVAL)[1]
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+        check = getattr(_cancel_check, 'func', None)
+        if not ready and not cancelled and check is not None and check():
+            logger.warning("Cancelling running query: the caller no longer needs the result")
+            conn.cancel()
+            cancelled = True
+
+extensions.set_wait_callback(_wait_select_cancellable)
+
+@contextmanager
+def cancel_when(check):
+    """
+    Cancel queries issued by this thread inside the block as soon as check() is True
+    """
+    previous = getattr(_cancel_check, 'func', None)
+    _cancel_check.func = check
+    try:
+        yield
+    finally:
+        _cancel_check.func = previous
+
+@contextmanager
+def heavy_query_slot(user_id):
+    """
+    Limit concurrent heavy queries per user, raising QueryBackpressureError when full
+    """
+    with _running_heavy_queries_lock:
+        running = _running_heavy_queries.get(user_id, 0)
+        if running >= MAX_HEAVY_QUERIES_PER_USER:
+            logger.warning(f"Shedding heavy query for user {user_id}: {running} already running")
+            raise QueryBackpressureError(
+                f"User {user_id} already has {running} heavy queries running"
+            )
+        _running_heavy_queries[user_id] = running + 1
     try:
-        logger.info("Attempting database connection")
-        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-        logger.info("Database connection successful")
+        yield
+    finally:
+        with _running_heavy_queries_lock:
+            running = _running_heavy_queries[user_id] - 1
+            if running:
+                _running_heavy_queries[user_id] = running
+            else:
+                del _running_heavy_queries[user_id]
+
+def get_database_connection(operation='interactive'):
+    try:
+        start_time = time.perf_counter()
+        dsn = os.getenv('DATABASE_URL')
+        # Passing options replaces those given in DATABASE_URL (or PGOPTIONS), so keep them
+        options = (extensions.parse_dsn(dsn).get('options') if dsn else None) or os.getenv('PGOPTIONS', '')
+        conn = psycopg2.connect(
+            dsn,
+            options=f"{options} -c statement_timeout={STATEMENT_TIMEOUTS[operation]}".strip()
+        )
+        log_event(logger, "DB_CONNECT", "Database connection successful",
+                  operation=operation,
+                  duration_ms=round((time.perf_counter() - start_time) * 1000, 2))
         return conn
     except Exception as e:
         logger.error(f"Database connection error: {str(e)}\n{traceback.format_exc()}")
         raise
 
+def get_table_kind(cur, table_name):
+    """
+    Return 'partitioned', 'table' or None if the table does not exist
+    """
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table_name,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return 'partitioned' if row[0] == 'p' else 'table'
+
+def partition_key_columns(mode=PARTITION_MODE):
+    if mode == 'hash':
+        return ('id', 'user_id')
+    if mode == 'range':
+        return ('id', 'created_at')
+    raise ValueError(f"Unsupported partitioning mode: {mode}")
+
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    return date(day.year + month_index // 12, month_index % 12 + 1, 1)
+
+def month_partition_name(month):
+    return f"music_videos_y{month.year}m{month.month:02d}"
+
+def create_month_partition(cur, table_name, month):
+    """
+    Create the partition for one month unless rows for it already sit in the default partition
+    """
+    partition = month_partition_name(month)
+    bounds = (month, add_months(month, 1))
+    if get_table_kind(cur, partition) is not None:
+        return
+
+    if get_table_kind(cur, 'music_videos_default') is not None:
+        cur.execute(
+            "SELECT EXISTS (SELECT 1 FROM music_videos_default WHERE created_at >= %s AND created_at < %s)",
+            bounds
+        )
+        if cur.fetchone()[0]:
+            # The month was created late (the process outlived RANGE_MONTHS_AHEAD). Moving its
+            # rows out of the default partition needs locks on the live table, so it is left
+            # to the online drain instead of running during startup.
+            logger.warning(
+                f"Rows for {partition} are in music_videos_default; "
+                "run backfill_partitions.py --drain-default to move them"
+            )
+            return
+
+    cur.execute(f'''
+        CREATE TABLE {partition} PARTITION OF {table_name}
+        FOR VALUES FROM (%s) TO (%s)
+    ''', bounds)
+
+def ensure_range_partitions(cur, table_name, start=None, months_ahead=RANGE_MONTHS_AHEAD):
+    """
+    Create monthly partitions from start up to months_ahead past the current month
+    """
+    today = date.today()
+    month = add_months(start or today, 0)
+    last = add_months(today, months_ahead)
+    while month <= last:
+        create_month_partition(cur, table_name, month)
+        month = add_months(month, 1)
+    # Rows outside the monthly ranges land here instead of failing the insert
+    cur.execute(f"CREATE TABLE IF NOT EXISTS music_videos_default PARTITION OF {table_name} DEFAULT")
+
+def create_partitioned_music_videos(cur, table_name, mode=PARTITION_MODE, range_start=None):
+    """
+    Create a partitioned music_videos table with a BIGINT identity key
+    """
+    key = partition_key_columns(mode)
+    partition_by = "HASH (user_id)" if mode == 'hash' else "RANGE (created_at)"
+    cur.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+            title VARCHAR(200) NOT NULL,
+            artist VARCHAR(200) NOT NULL,
+            url VARCHAR(500) NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY ({", ".join(key)})
+        ) PARTITION BY {partition_by}
+    ''')
+
+    if mode == 'hash':
+        for remainder in range(HASH_PARTITIONS):
+            cur.execute(f'''
+                CREATE TABLE IF NOT EXISTS music_videos_p{remainder}
+                PARTITION OF {table_name}
+                FOR VALUES WITH (MODULUS {HASH_PARTITIONS}, REMAINDER {remainder})
+            ''')
+    else:
+        ensure_range_partitions(cur, table_name, start=range_start)
+
+    # Per-user listing is the hot path; keep it an index range scan inside each partition
+    cur.execute(f'''
+        CREATE INDEX IF NOT EXISTS {table_name}_user_created_idx
+        ON {table_name} (user_id, created_at DESC)
+    ''')
+
+def migrate_music_videos(cur):
+    kind = get_table_kind(cur, 'music_videos')
+
+    if kind is None:
+        logger.info(f"Creating music_videos partitioned by {PARTITION_MODE}")
+        create_partitioned_music_videos(cur, 'music_videos')
+    elif kind == 'partitioned':
+        if PARTITION_MODE == 'range':
+            ensure_range_partitions(cur, 'music_videos')
+    else:
+        # Existing heap table: prepare the target and leave the row move to the online backfill
+        cur.execute("SELECT MIN(created_at) FROM music_videos")
+        oldest = cur.fetchone()[0]
+        create_partitioned_music_videos(
+            cur, PARTITIONED_TABLE, range_start=oldest.date() if oldest else None
+        )
+        logger.warning(
+            f"music_videos is not partitioned; created {PARTITIONED_TABLE}. "
+            "Run backfill_partitions.py to move existing rows."
+        )
+
 def init_db():
     logger.info("Initializing database")
-    conn = get_database_connection()
+    conn = get_database_connection('admin')
     cur = conn.cursor()
-    
+
     try:
+        cur.execute("SET LOCAL lock_timeout = %s", (MIGRATION_LOCK_TIMEOUT,))
+
         # Create users table
         cur.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -29,24 +268,28 @@ def init_db():
                 email VARCHAR(100) UNIQUE NOT NULL
             )
         ''')
-        
+
         # Create music_videos table
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS music_videos (
-                id SERIAL PRIMARY KEY,
-                title VARCHAR(200) NOT NULL,
-                artist VARCHAR(200) NOT NULL,
-                url VARCHAR(500) NOT NULL,
-                user_id INTEGER REFERENCES users(id),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
+        if PARTITION_MODE == 'none':
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS music_videos (
+                    id SERIAL PRIMARY KEY,
+                    title VARCHAR(200) NOT NULL,
+                    artist VARCHAR(200) NOT NULL,
+                    url VARCHAR(500) NOT NULL,
+                    user_id INTEGER REFERENCES users(id),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        else:
+            migrate_music_videos(cur)
+
         conn.commit()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization error: {str(e)}\n{traceback.format_exc()}")
         conn.rollback()
+        raise
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
@@ -0,0 +1,317 @@
+"""
+Offline analytics for the application logs.
+
+    python log_analytics.py [paths ...] [--bucket-minutes 60] [--histogram] [--json]
+
+Streams the daily log files in constant memory and reports per-function latency
+percentiles (from log_performance), record and error counts by event type, and error
+rates per time bucket. Paths may be files or directories; directories expand to their
+app_*.log* files, which hold every record including errors (pass error_*.log files
+explicitly to look at those alone). Rotated and gzip-compressed (.gz) files are
+supported, and both the text and the LOG_FORMAT=json line formats are understood.
+Sampled records are weighted by 1/sample_rate. Messages without an event type are
+grouped by their text before the first colon, with numbers, quoted values and the
+user/video names that follow "user"/"video" masked; at most --max-event-types distinct
+event types are tracked and the rest are counted under OTHER. Records with malformed
+fields are counted as skipped, and a truncated or corrupt file is reported and the
+remaining files are still read.
+"""
+import argparse
+import ast
+import glob
+import gzip
+import json
+import math
+import os
+import re
+import sys
+import zlib
+from collections import defaultdict
+from datetime import datetime
+
+# Bytes read per chunk; lines are parsed a chunk at a time
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Latency histogram resolution: bucket bounds grow by 5%, so percentiles are within ~5%
+BUCKET_GROWTH = 1.05
+LOG_BUCKET_GROWTH = math.log(BUCKET_GROWTH)
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Distinct event types tracked before further ones are folded into OTHER
+MAX_EVENT_TYPES = 200
+
+TEXT_LINE = re.compile(
+    r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+ - \S+ - (\w+) - \[[^\]]*\] - (.*)$'
+)
+PERFORMANCE_MESSAGE = re.compile(r'Function (\w+) executed in ([\d.]+) seconds')
+STREAMLIT_MESSAGE = re.compile(r'^Streamlit (\w+):')
+ADDITIONAL_DATA = ' | Additional Data: '
+QUOTED_VALUE = re.compile(r"'[^']*'|\"[^\"]*\"")
+NAMED_VALUE = re.compile(r'\b(user|video)\s+\S.*$', re.IGNORECASE)
+NUMBER = re.compile(r'\d+(?:\.\d+)?')
+KNOWN_MESSAGES = {
+    'Database connection successful': 'DB_CONNECT',
+    'Application started': 'APP_RUN',
+}
+ERROR_LEVELS = ('ERROR', 'CRITICAL')
+
+def message_event_type(message):
+    """
+    Event type for a message logged without one, with user-supplied values masked
+    """
+    message = message.split(':', 1)[0]
+    if message in KNOWN_MESSAGES:
+        return KNOWN_MESSAGES[message]
+    message = QUOTED_VALUE.sub('*', message)
+    message = NAMED_VALUE.sub(r'\1 *', message)
+    return NUMBER.sub('#', message)[:60]
+
+def parse_additional_data(data):
+    """
+    Parse the dict repr that the text formatter appends; unparseable data is ignored
+    """
+    try:
+        fields = ast.literal_eval(data)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return {}
+    return fields if isinstance(fields, dict) else {}
+
+def parse_duration(value):
+    """
+    Duration in milliseconds as a float; ValueError/TypeError for anything else
+    """
+    if value is None:
+        return None
+    duration_ms = float(value)
+    if not math.isfinite(duration_ms):
+        raise ValueError(f"Invalid duration: {value}")
+    return duration_ms
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with O(number of buckets) memory
+    """
+    def __init__(self):
+        self.buckets = defaultdict(float)
+        self.count = 0.0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, duration_ms, weight=1.0):
+        # Durations below 1ms (or rounded to 0 in text logs) share bucket 0
+        index = int(math.log(duration_ms) / LOG_BUCKET_GROWTH) + 1 if duration_ms >= 1 else 0
+        self.buckets[index] += weight
+        self.count += weight
+        self.total_ms += duration_ms * weight
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    @staticmethod
+    def upper_bound(index):
+        return BUCKET_GROWTH ** index if index else 1.0
+
+    def percentile(self, pct):
+        target = self.count * pct / 100
+        seen = 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(self.upper_bound(index), self.max_ms)
+        return self.max_ms
+
+    def coarse(self):
+        """
+        Counts per power-of-two millisecond range for display
+        """
+        ranges = defaultdict(float)
+        for index, count in self.buckets.items():
+            ranges[math.ceil(math.log2(self.upper_bound(index)))] += count
+        return sorted(ranges.items())
+
+class LogStats:
+    def __init__(self, bucket_minutes, max_event_types=MAX_EVENT_TYPES):
+        self.bucket_seconds = bucket_minutes * 60
+        self.max_event_types = max_event_types
+        self.latency = defaultdict(LatencyHistogram)
+        self.events = defaultdict(lambda: [0.0, 0.0])
+        self.time_buckets = defaultdict(lambda: [0.0, 0.0])
+        self.lines = 0
+        self.skipped = 0
+        self.file_errors = []
+
+    def add(self, timestamp, level, event_type, weight=1.0, function=None, duration_ms=None):
+        is_error = level in ERROR_LEVELS
+        if event_type not in self.events and len(self.events) >= self.max_event_types:
+            event_type = 'OTHER'
+        counts = self.events[event_type]
+        counts[0] += weight
+        counts[1] += weight if is_error else 0
+        if timestamp is not None:
+            bucket = int(timestamp.timestamp()) // self.bucket_seconds * self.bucket_seconds
+            counts = self.time_buckets[bucket]
+            counts[0] += weight
+            counts[1] += weight if is_error else 0
+        if function is not None and duration_ms is not None:
+            self.latency[function].add(duration_ms, weight)
+
+    def parse_text(self, line):
+        match = TEXT_LINE.match(line)
+        if not match:
+            # Traceback continuation lines and anything else that is not a record
+            self.skipped += 1
+            return
+        timestamp, level, message = match.groups()
+        fields = {}
+        if ADDITIONAL_DATA in message:
+            message, data = message.split(ADDITIONAL_DATA, 1)
+            fields = parse_additional_data(data)
+
+        function = fields.get('function')
+        try:
+            duration_ms = parse_duration(fields.get('duration_ms'))
+        except (TypeError, ValueError):
+            self.skipped += 1
+            return
+        performance = PERFORMANCE_MESSAGE.search(message)
+        if performance:
+            event_type = 'PERFORMANCE'
+            function = function or performance.group(1)
+            # The message is rounded to 10ms; prefer the exact field when it was logged
+            if duration_ms is None:
+                duration_ms = float(performance.group(2)) * 1000
+        else:
+            streamlit = STREAMLIT_MESSAGE.match(message)
+            event_type = streamlit.group(1) if streamlit else message_event_type(message)
+        self.add(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S'), level, event_type,
+                 weight=self.weight(fields), function=function, duration_ms=duration_ms)
+
+    @staticmethod
+    def weight(fields):
+        try:
+            return 1.0 / float(fields.get('sample_rate') or 1.0)
+        except (TypeError, ValueError, ZeroDivisionError):
+            return 1.0
+
+    def parse_json(self, line):
+        try:
+            record = json.loads(line)
+            timestamp = datetime.fromisoformat(record['ts']) if record.get('ts') else None
+            event_type = record.get('event') or message_event_type(record.get('message', ''))
+            duration_ms = parse_duration(record.get('duration_ms'))
+        except (ValueError, TypeError, AttributeError):
+            # Not a JSON object, or a field of the wrong type
+            self.skipped += 1
+            return
+        self.add(timestamp, record.get('level', 'INFO'), event_type,
+                 weight=self.weight(record),
+                 function=record.get('function'),
+                 duration_ms=duration_ms)
+
+    def parse_file(self, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as log_file:
+            while True:
+                chunk = log_file.readlines(CHUNK_SIZE)
+                if not chunk:
+                    break
+                for raw in chunk:
+                    line = raw.decode('utf-8', errors='replace').rstrip('\n')
+                    if not line:
+                        continue
+                    self.lines += 1
+                    if line.startswith('{'):
+                        self.parse_json(line)
+                    else:
+                        self.parse_text(line)
+
+def expand_paths(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, 'app_*.log*')))
+        else:
+            files.append(path)
+    return files
+
+def report(stats, show_histogram):
+    print(f"Lines read: {stats.lines} (skipped {stats.skipped})")
+    for path, error in stats.file_errors:
+        print(f"Incomplete file {path}: {error}")
+
+    print("\nLatency by function (ms)")
+    print(f"  {'function':<28}{'count':>10}{'mean':>10}"
+          + "".join(f"{f'p{pct}':>10}" for pct in PERCENTILES) + f"{'max':>10}")
+    for function, histogram in sorted(stats.latency.items(), key=lambda item: -item[1].total_ms):
+        print(f"  {function:<28}{histogram.count:>10.0f}{histogram.total_ms / histogram.count:>10.1f}"
+              + "".join(f"{histogram.percentile(pct):>10.1f}" for pct in PERCENTILES)
+              + f"{histogram.max_ms:>10.1f}")
+        if show_histogram:
+            for exponent, count in histogram.coarse():
+                bar = '#' * max(1, int(40 * count / histogram.count))
+                print(f"    <= {2 ** exponent:>8.0f}ms {count:>10.0f} {bar}")
+
+    print("\nEvents")
+    print(f"  {'event':<60}{'records':>10}{'errors':>10}{'error %':>10}")
+    for event_type, (total, errors) in sorted(stats.events.items(), key=lambda item: -item[1][0]):
+        print(f"  {event_type:<60}{total:>10.0f}{errors:>10.0f}{100 * errors / total:>10.2f}")
+
+    print("\nTime buckets")
+    print(f"  {'start':<20}{'records':>10}{'errors':>10}{'error %':>10}")
+    for bucket, (total, errors) in sorted(stats.time_buckets.items()):
+        start = datetime.fromtimestamp(bucket).strftime('%Y-%m-%d %H:%M')
+        print(f"  {start:<20}{total:>10.0f}{errors:>10.0f}{100 * errors / total:>10.2f}")
+
+def report_json(stats):
+    print(json.dumps({
+        'lines': stats.lines,
+        'skipped': stats.skipped,
+        'file_errors': {path: error for path, error in stats.file_errors},
+        'latency_ms': {
+            function: {
+                'count': histogram.count,
+                'mean': histogram.total_ms / histogram.count,
+                'max': histogram.max_ms,
+                **{f'p{pct}': histogram.percentile(pct) for pct in PERCENTILES},
+            }
+            for function, histogram in stats.latency.items()
+        },
+        'events': {
+            event_type: {'records': total, 'errors': errors}
+            for event_type, (total, errors) in stats.events.items()
+        },
+        'time_buckets': {
+            datetime.fromtimestamp(bucket).isoformat(): {'records': total, 'errors': errors}
+            for bucket, (total, errors) in sorted(stats.time_buckets.items())
+        },
+    }, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency percentiles and error rates from the app logs")
+    parser.add_argument("paths", nargs="*", default=["logs"], help="Log files or directories (default: logs)")
+    parser.add_argument("--bucket-minutes", type=int, default=60, help="Width of the time buckets")
+    parser.add_argument("--histogram", action="store_true", help="Print a latency histogram per function")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--max-event-types", type=int, default=MAX_EVENT_TYPES,
+                        help="Distinct event types tracked before the rest are counted as OTHER")
+    args = parser.parse_args()
+
+    files = expand_paths(args.paths)
+    if not files:
+        parser.error("No log files found")
+
+    stats = LogStats(args.bucket_minutes, args.max_event_types)
+    for path in files:
+        try:
+            stats.parse_file(path)
+        except (EOFError, OSError, zlib.error) as e:
+            # A truncated or corrupt .gz (e.g. still being written) keeps the lines read so far
+            stats.file_errors.append((path, str(e) or type(e).__name__))
+            print(f"Could not read all of {path}: {e}", file=sys.stderr)
+
+    if args.json:
+        report_json(stats)
+    else:
+        report(stats, args.histogram)
+
+if __name__ == "__main__":
+    main()
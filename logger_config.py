@@ -1,6 +1,9 @@
+import json
 import logging
 import logging.handlers
 import os
+import random
+import sys
 from datetime import datetime
 
 # Create logs directory if it doesn't exist
@@ -10,9 +13,102 @@ if not os.path.exists('logs'):
 # Get current date for log file name
 current_date = datetime.now().strftime('%Y-%m-%d')
 
+def _parse_event_settings(value, convert):
+    """
+    Parse "EVENT=value,EVENT=value" into a dict, skipping malformed entries
+    """
+    settings = {}
+    for item in (value or '').split(','):
+        event_type, _, setting = item.partition('=')
+        if event_type.strip() and setting.strip():
+            try:
+                settings[event_type.strip().upper()] = convert(setting.strip())
+            except ValueError:
+                pass
+    return settings
+
+def _level(name):
+    level = logging.getLevelName(name.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+# 'text' keeps the original line format; 'json' writes one JSON object per line
+LOG_FORMAT = 'text'
+
+# Fraction of records kept per event type; high-volume events are sampled by default
+DEFAULT_SAMPLE_RATES = {'DB_CONNECT': 0.01, 'APP_RUN': 0.01}
+SAMPLE_RATES = dict(DEFAULT_SAMPLE_RATES)
+
+# Per event type minimum level; records of that event below it are dropped before any
+# formatting, e.g. LOG_LEVEL_OVERRIDES="DB_CONNECT=WARNING" turns connect records off
+LEVEL_OVERRIDES = {}
+
+def _load_settings():
+    """
+    Read LOG_FORMAT, LOG_SAMPLE_RATES and LOG_LEVEL_OVERRIDES when the logger is set up,
+    after the caller has loaded .env
+    """
+    global LOG_FORMAT, SAMPLE_RATES, LEVEL_OVERRIDES
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+    SAMPLE_RATES = {**DEFAULT_SAMPLE_RATES,
+                    **_parse_event_settings(os.getenv('LOG_SAMPLE_RATES'), float)}
+    LEVEL_OVERRIDES = _parse_event_settings(os.getenv('LOG_LEVEL_OVERRIDES'), _level)
+
+class SessionContextFilter(logging.Filter):
+    """
+    Adds the Streamlit session id to records logged from a script run
+    """
+    def filter(self, record):
+        # Only look up the context if Streamlit is already loaded (not in CLI tools)
+        scriptrunner = sys.modules.get('streamlit.runtime.scriptrunner')
+        ctx = scriptrunner.get_script_run_ctx() if scriptrunner else None
+        record.session_id = ctx.session_id if ctx else None
+        return True
+
+class TextFormatter(logging.Formatter):
+    """
+    The original line format; only log_streamlit_event extra_data (and the sample rate of
+    sampled records) is appended, other event fields are left to json mode
+    """
+    def format(self, record):
+        message = super().format(record)
+        text_data = getattr(record, 'text_data', None)
+        if text_data:
+            message += f" | Additional Data: {text_data}"
+        return message
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record; event fields that clash with a record key get a field_ prefix
+    """
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+            'message': record.getMessage(),
+            'source': f"{record.filename}:{record.lineno}",
+        }
+        session_id = getattr(record, 'session_id', None)
+        if session_id:
+            entry['session_id'] = session_id
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        for name, value in (getattr(record, 'event_fields', None) or {}).items():
+            while name in entry:
+                name = f"field_{name}"
+            entry[name] = value
+        return json.dumps(entry, default=str)
+
 def setup_logger():
     # Create logger
     logger = logging.getLogger('StreamlitApp')
+    # Every module and every Streamlit rerun calls this; attach the handlers only once
+    if logger.handlers:
+        return logger
+    _load_settings()
     logger.setLevel(logging.DEBUG)
 
     # Create handlers
@@ -31,12 +127,16 @@ def setup_logger():
     console_handler.setLevel(logging.INFO)
 
     # Create formatters and add it to the handlers
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
-    )
-    console_formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s'
-    )
+    if LOG_FORMAT == 'json':
+        file_formatter = console_formatter = JsonFormatter()
+        logger.addFilter(SessionContextFilter())
+    else:
+        file_formatter = TextFormatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+        )
+        console_formatter = TextFormatter(
+            '%(asctime)s - %(levelname)s - %(message)s'
+        )
 
     file_handler.setFormatter(file_formatter)
     error_file_handler.setFormatter(file_formatter)
@@ -49,9 +149,27 @@ def setup_logger():
 
     return logger
 
+def _log_event(logger, event_type, message, level, stacklevel, fields, text_data):
+    if level < LEVEL_OVERRIDES.get(event_type, logging.NOTSET) or not logger.isEnabledFor(level):
+        return
+    sample_rate = SAMPLE_RATES.get(event_type, 1.0)
+    if sample_rate < 1.0:
+        if random.random() >= sample_rate:
+            return
+        fields['sample_rate'] = sample_rate
+        text_data = {**(text_data or {}), 'sample_rate': sample_rate}
+    logger.log(level, message,
+               extra={'event': event_type, 'event_fields': fields, 'text_data': text_data},
+               stacklevel=stacklevel + 2)
+
+def log_event(logger, event_type, message, level=logging.INFO, stacklevel=1, **fields):
+    """
+    Log a structured event, applying the minimum level and sampling rate for its type.
+    Keyword arguments become fields of the record (JSON keys in json mode).
+    """
+    _log_event(logger, event_type, message, level, stacklevel, fields, None)
+
 # Create a function to log Streamlit events
 def log_streamlit_event(logger, event_type, message, extra_data=None):
-    log_message = f"Streamlit {event_type}: {message}"
-    if extra_data:
-        log_message += f" | Additional Data: {extra_data}"
-    logger.info(log_message)
\ No newline at end of file
+    _log_event(logger, event_type, f"Streamlit {event_type}: {message}", logging.INFO, 1,
+               dict(extra_data or {}), extra_data)
@@ -1,15 +1,44 @@
+from dotenv import load_dotenv
+
+# Load .env before the modules below read their settings at import
+load_dotenv()
+
 import streamlit as st
 import logging
-from database import get_database_connection, init_db
-from auth import hash_password, verify_password, create_access_token, verify_token
-from logger_config import setup_logger, log_streamlit_event
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from database import (
+    get_database_connection, init_db, cancel_when, heavy_query_slot,
+    QueryBackpressureError, QueryCanceled
+)
+from auth import hash_password, verify_password, create_access_token, verify_token, preload
+from logger_config import setup_logger, log_event, log_streamlit_event
+import threading
 import traceback
 import time
 
 # Setup logger
 logger = setup_logger()
-# initialize db
-init_db()
+
+@st.cache_resource(show_spinner=False)
+def warm_up():
+    """
+    Runs once per server process: creates the schema (opening the first database
+    connection) and loads the auth libraries in the background. Errors propagate so
+    that a failed start is not cached and the next rerun tries again.
+    """
+    start_time = time.time()
+    init_db()
+    threading.Thread(target=preload, name="auth-preload", daemon=True).start()
+    logger.info(f"Warm-up completed in {time.time() - start_time:.2f} seconds")
+    return True
+
+# Streamlit re-executes this script on every interaction; warm_up() is cached so the
+# database is initialised once per process instead of on each rerun
+try:
+    warm_up()
+except Exception:
+    st.error("The database is not available right now. Please reload the page to try again.")
+    st.stop()
 
 # Add performance monitoring
 def log_performance(func):
@@ -19,13 +48,97 @@ def log_performance(func):
             result = func(*args, **kwargs)
             end_time = time.time()
             execution_time = end_time - start_time
-            logger.info(f"Function {func.__name__} executed in {execution_time:.2f} seconds")
+            log_event(logger, "PERFORMANCE", f"Function {func.__name__} executed in {execution_time:.2f} seconds",
+                      function=func.__name__, duration_ms=round(execution_time * 1000, 2))
             return result
         except Exception as e:
             logger.error(f"Error in {func.__name__}: {str(e)}\n{traceback.format_exc()}")
             raise
     return wrapper
 
+_rerun_probe_warned = False
+
+def session_stopping():
+    """
+    True once the browser session is gone or Streamlit asked this script run to stop or rerun
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return False
+    if st.runtime.exists() and not st.runtime.get_instance().is_active_session(ctx.session_id):
+        return True
+    # Streamlit has no public hook for a pending rerun; this reads private state of the
+    # versions allowed by requirements.txt and only falls back to the session check otherwise
+    requests = getattr(ctx, "script_requests", None)
+    state = getattr(requests, "_state", None)
+    if state is None:
+        global _rerun_probe_warned
+        if not _rerun_probe_warned:
+            _rerun_probe_warned = True
+            logger.warning(f"Streamlit {st.__version__} has no script_requests state; "
+                           "queries are only cancelled when the session closes")
+        return False
+    return getattr(state, "name", "CONTINUE") != "CONTINUE"
+
+def fetch_dataframe(cur, query, params):
+    """
+    Run a query and return the rows as a DataFrame named after the result columns
+    """
+    # pandas is only needed by the video tables, not the login page; import it on first use
+    import pandas as pd
+    cur.execute(query, params)
+    columns = [column[0] for column in cur.description]
+    return pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+
+def render_video_table(videos, key, user_id):
+    """
+    Render videos as a single sortable, editable table and save only the edited rows
+    """
+    edited = st.data_editor(
+        videos,
+        key=key,
+        hide_index=True,
+        use_container_width=True,
+        column_order=[column for column in ("title", "artist", "url", "created_at") if column in videos.columns],
+        column_config={
+            "title": st.column_config.TextColumn("Title", required=True, max_chars=200),
+            "artist": st.column_config.TextColumn("Artist", required=True, max_chars=200),
+            "url": st.column_config.LinkColumn("URL", required=True, max_chars=500),
+            "created_at": st.column_config.DatetimeColumn("Added on"),
+        },
+        disabled=["id", "created_at"],
+    )
+
+    # The editor state only holds the cells that changed, keyed by row position
+    edited_rows = st.session_state[key]["edited_rows"]
+    if edited_rows and st.button("Save Changes", key=f"{key}_save"):
+        save_video_edits(edited.iloc[sorted(edited_rows)], user_id)
+
+def save_video_edits(changed, user_id):
+    cur = None
+    conn = None
+    try:
+        conn = get_database_connection()
+        cur = conn.cursor()
+        cur.executemany("""
+            UPDATE music_videos
+            SET title = %s, artist = %s, url = %s
+            WHERE id = %s AND user_id = %s
+        """, [
+            (row.title, row.artist, row.url, int(row.id), user_id)
+            for row in changed.itertuples(index=False)
+        ])
+        conn.commit()
+        st.success(f"Updated {len(changed)} video(s)")
+        log_streamlit_event(logger, "UPDATE_VIDEO", f"Videos updated from table: {len(changed)}",
+                            {"user_id": user_id, "video_ids": changed["id"].tolist()})
+    except Exception as e:
+        logger.error(f"Error saving video edits: {str(e)}\n{traceback.format_exc()}")
+        st.error("Error saving changes")
+    finally:
+        if cur: cur.close()
+        if conn: conn.close()
+
 @log_performance
 def signup():
     st.subheader("Create New Account")
@@ -95,7 +208,8 @@ def login():
                 st.success("Logged in successfully!")
                 
                 # Log event
-                log_streamlit_event(logger, "LOGIN", f"User logged in: {username}")
+                log_streamlit_event(logger, "LOGIN", f"User logged in: {username}",
+                                    {"user_id": result[0]})
             else:
                 logger.warning(f"Failed login attempt for user: {username}")
                 st.error("Invalid username or password")
@@ -194,25 +308,22 @@ def manage_music_videos():
     # Tab 2: List all videos
     with tab2:
         st.write("Your Music Videos")
+        cur = None
+        conn = None
         try:
             conn = get_database_connection()
             cur = conn.cursor()
             user_id = verify_token(st.session_state['token'])['user_id']
             
-            cur.execute("""
+            videos = fetch_dataframe(cur, """
                 SELECT id, title, artist, url, created_at 
                 FROM music_videos 
                 WHERE user_id = %s 
                 ORDER BY created_at DESC
             """, (user_id,))
             
-            videos = cur.fetchall()
-            
-            if videos:
-                for video in videos:
-                    with st.expander(f"{video[1]} - {video[2]}"):
-                        st.write(f"URL: {video[3]}")
-                        st.write(f"Added on: {video[4]}")
+            if not videos.empty:
+                render_video_table(videos, "list_videos", user_id)
             else:
                 st.info("No videos found")
                 
@@ -229,33 +340,38 @@ def manage_music_videos():
         search_term = st.text_input("Enter search term")
         search_by = st.selectbox("Search by", ["Title", "Artist"])
         
+        # Keep the last search so the results table survives reruns caused by editing it
         if st.button("Search"):
+            st.session_state['video_search'] = (search_by, search_term)
+        
+        if 'video_search' in st.session_state:
+            cur = None
+            conn = None
             try:
                 conn = get_database_connection()
                 cur = conn.cursor()
                 user_id = verify_token(st.session_state['token'])['user_id']
+                searched_by, searched_term = st.session_state['video_search']
+                column = "title" if searched_by == "Title" else "artist"
                 
-                if search_by == "Title":
-                    cur.execute("""
-                        SELECT id, title, artist, url 
-                        FROM music_videos 
-                        WHERE user_id = %s AND title ILIKE %s
-                    """, (user_id, f"%{search_term}%"))
-                else:
-                    cur.execute("""
+                with heavy_query_slot(user_id):
+                    results = fetch_dataframe(cur, f"""
                         SELECT id, title, artist, url 
                         FROM music_videos 
-                        WHERE user_id = %s AND artist ILIKE %s
-                    """, (user_id, f"%{search_term}%"))
+                        WHERE user_id = %s AND {column} ILIKE %s
+                    """, (user_id, f"%{searched_term}%"))
                 
-                results = cur.fetchall()
-                if results:
-                    for result in results:
-                        with st.expander(f"{result[1]} - {result[2]}"):
-                            st.write(f"URL: {result[3]}")
+                if not results.empty:
+                    render_video_table(results, "search_videos", user_id)
                 else:
                     st.info("No matching videos found")
                     
+            except QueryBackpressureError:
+                st.warning("You already have searches running. Please wait for them to finish and try again.")
+            except QueryCanceled:
+                logger.warning(f"Search cancelled or timed out: {searched_by} ILIKE {searched_term}")
+                st.warning("The search was stopped because it took too long or the page changed. "
+                           "Try again, or use a more specific search term.")
             except Exception as e:
                 logger.error(f"Error searching videos: {str(e)}")
                 st.error("Error searching videos")
@@ -363,8 +479,13 @@ def manage_music_videos():
             if conn: conn.close()
 
 def main():
+    # Abandon in-flight queries once the session is closed or the script run is superseded
+    with cancel_when(session_stopping):
+        run_app()
+
+def run_app():
     try:
-        logger.info("Application started")
+        log_event(logger, "APP_RUN", "Application started")
         
         # Initialize session states if not exists
         if 'page' not in st.session_state: